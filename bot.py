@@ -1,8 +1,20 @@
 import os
+import sys
 import json
+import base64
+import re
 import asyncio
 import requests
 import time
+import shutil
+import threading
+import sqlite3
+import signal
+import subprocess
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing, closing
 from pathlib import Path
 from tqdm import tqdm
 from datetime import datetime
@@ -12,20 +24,163 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def hash_part(chunk):
+    return hashlib.md5(chunk).hexdigest(), hashlib.sha256(chunk).hexdigest()
+
+def hash_file(path, block_size=4 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def create_hash_pool(workers):
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+
+class TokenBucket:
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        rate = max(0, rate)
+        with self.lock:
+            self.rate = rate
+            self.capacity = max(rate, 64 * 1024)
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+
+    def consume(self, amount):
+        with self.lock:
+            if not self.rate:
+                return 0
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def is_idle(self, idle_seconds):
+        with self.lock:
+            idle = time.monotonic() - self.updated
+            if idle < idle_seconds:
+                return False
+            return not self.rate or self.tokens + idle * self.rate >= self.capacity
+
+class BandwidthLimiter:
+    IDLE_SECONDS = 300
+
+    def __init__(self, global_rate=0, user_rate=0, shares=1):
+        self.lock = threading.Lock()
+        self.shares = max(1, shares)
+        self.global_rate = global_rate
+        self.global_bucket = TokenBucket(self._share(global_rate))
+        self.user_rate = user_rate
+        self.user_overrides = {}
+        self.user_buckets = {}
+        self.last_prune = time.monotonic()
+
+    def _share(self, rate):
+        return max(1, rate // self.shares) if rate > 0 else 0
+
+    def set_global_rate(self, rate):
+        self.global_rate = rate
+        self.global_bucket.set_rate(self._share(rate))
+
+    def set_user_rate(self, rate, user_id=None):
+        with self.lock:
+            if user_id is None:
+                self.user_rate = rate
+            else:
+                self.user_overrides[user_id] = rate
+            for uid, bucket in self.user_buckets.items():
+                bucket.set_rate(self._share(self.user_overrides.get(uid, self.user_rate)))
+
+    def _prune(self):
+        self.last_prune = time.monotonic()
+        idle_users = [
+            uid for uid, bucket in self.user_buckets.items() if bucket.is_idle(self.IDLE_SECONDS)
+        ]
+        for uid in idle_users:
+            del self.user_buckets[uid]
+
+    def _user_bucket(self, user_id):
+        with self.lock:
+            if time.monotonic() - self.last_prune > 60:
+                self._prune()
+            bucket = self.user_buckets.get(user_id)
+            if not bucket:
+                bucket = TokenBucket(self._share(self.user_overrides.get(user_id, self.user_rate)))
+                self.user_buckets[user_id] = bucket
+            return bucket
+
+    def throttle(self, user_id, amount):
+        wait = max(
+            self.global_bucket.consume(amount),
+            self._user_bucket(user_id).consume(amount),
+        )
+        if wait > 0:
+            time.sleep(wait)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "global_rate": self.global_rate,
+                "user_rate": self.user_rate,
+                "user_overrides": {str(uid): rate for uid, rate in self.user_overrides.items()},
+            }
+
+    def load(self, settings):
+        if settings.get("global_rate") != self.global_rate:
+            self.set_global_rate(settings.get("global_rate", 0))
+        overrides = {int(uid): rate for uid, rate in settings.get("user_overrides", {}).items()}
+        if settings.get("user_rate") != self.user_rate or overrides != self.user_overrides:
+            with self.lock:
+                self.user_overrides = overrides
+            self.set_user_rate(settings.get("user_rate", 0))
+
+class ThrottledReader:
+    def __init__(self, data, throttle, block_size=64 * 1024):
+        self.data = data
+        self.throttle = throttle
+        self.block_size = block_size
+        self.position = 0
+
+    def __len__(self):
+        return len(self.data) - self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.data) - self.position
+        size = min(size, self.block_size)
+        block = self.data[self.position:self.position + size]
+        if block:
+            self.throttle(len(block))
+        self.position += len(block)
+        return block
+
 class abrehamrahiStorage:
-    def __init__(self, access_token=None, refresh_token=None, token_file="tokens.json"):
+    def __init__(self, access_token=None, refresh_token=None, token_file="tokens.json", pool_size=10):
         self.base_url = "https://abrehamrahi.ir"
         self.token_file = token_file
         self.access_token = access_token
         self.refresh_token = refresh_token
         self._load_tokens()
         self._update_session_headers()
+        
+        self.chunk_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.chunk_session.mount('https://', adapter)
+        self.chunk_session.mount('http://', adapter)
 
     def _load_tokens(self):
         try:
             if os.path.exists(self.token_file):
                 with open(self.token_file, 'r') as f:
                     tokens = json.load(f)
+                    if self.refresh_token and tokens.get('refresh_token') != self.refresh_token:
+                        return
                     self.access_token = tokens.get('access_token')
                     self.refresh_token = tokens.get('refresh_token')
         except Exception:
@@ -56,6 +211,25 @@ class abrehamrahiStorage:
             self.session = requests.Session()
         self.session.headers.update(self.headers)
 
+    def _token_expiry(self):
+        try:
+            payload = self.access_token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        except Exception:
+            return None
+
+    def has_valid_access_token(self, leeway=60):
+        if not self.access_token:
+            return False
+        expiry = self._token_expiry()
+        return expiry is None or expiry - leeway > time.time()
+
+    def ensure_access_token(self):
+        if self.has_valid_access_token():
+            return True
+        return self.refresh_access_token()
+
     def get_access_token_from_refresh(self, refresh_token):
         url = f"{self.base_url}/api/v2/profile/auth/token-refresh/"
         data = {"refresh": refresh_token}
@@ -125,14 +299,14 @@ class abrehamrahiStorage:
         response.raise_for_status()
         return response.json()
 
-    def upload_file_part(self, signed_url, chunk_data, part_number):
+    def upload_file_part(self, signed_url, chunk_data, part_number, throttle=None):
         headers = {'content-type': 'application/octet-stream'}
         
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                chunk_session = requests.Session()
-                response = chunk_session.put(signed_url, data=chunk_data, headers=headers, timeout=30)
+                body = ThrottledReader(chunk_data, throttle) if throttle else chunk_data
+                response = self.chunk_session.put(signed_url, data=body, headers=headers, timeout=30)
                 response.raise_for_status()
                 etag = response.headers.get('ETag', '').strip('"')
                 if not etag:
@@ -187,10 +361,15 @@ class abrehamrahiStorage:
         response.raise_for_status()
         return response.json()
 
-    def list_objects(self, is_trash=False, limit=1000):
+    def list_objects(self, is_trash=False, limit=1000, offset=0):
         url = f"{self.base_url}/api/v2/flat/list-objects/"
-        params = {"is_trash": str(is_trash).lower(), "limit": limit}
+        params = {"is_trash": str(is_trash).lower(), "limit": limit, "offset": offset}
         response = self.session.get(url, params=params)
+        
+        if response.status_code == 401:
+            if self.refresh_access_token():
+                response = self.session.get(url, params=params)
+        
         response.raise_for_status()
         return response.json()
 
@@ -258,26 +437,578 @@ class abrehamrahiStorage:
             i += 1
         return f"{size_bytes:.2f} {size_names[i]}"
 
+class StoragePool:
+    PROFILE_TTL = 300
+    LIMIT_KEYS = ('storage_limit', 'total_storage', 'quota', 'max_storage')
+    USED_KEYS = ('storage_used', 'used_storage', 'usage', 'used_space')
+
+    def __init__(self, refresh_tokens, pool_size=10):
+        self.lock = threading.Lock()
+        self.accounts = []
+        for index, refresh_token in enumerate(refresh_tokens):
+            token_file = "tokens.json" if index == 0 else f"tokens_{index}.json"
+            self.accounts.append({
+                "index": index,
+                "refresh_token": refresh_token,
+                "storage": abrehamrahiStorage(refresh_token=refresh_token, token_file=token_file, pool_size=pool_size),
+                "enabled": True,
+                "active_uploads": 0,
+                "error_rate": 0.0,
+                "free_bytes": None,
+                "profile_checked": 0,
+                "quota_warned": False,
+            })
+
+    def authenticate(self, reuse_cached=True):
+        for account in self.accounts:
+            storage = account["storage"]
+            if reuse_cached and storage.has_valid_access_token():
+                account["enabled"] = True
+            else:
+                account["enabled"] = storage.get_access_token_from_refresh(account["refresh_token"])
+        return [account for account in self.accounts if account["enabled"]]
+
+    def _free_space(self, profile):
+        limit = next((profile[k] for k in self.LIMIT_KEYS if isinstance(profile.get(k), (int, float))), None)
+        used = next((profile[k] for k in self.USED_KEYS if isinstance(profile.get(k), (int, float))), None)
+        if limit is None or used is None:
+            return None
+        return max(0, limit - used)
+
+    def fetch_profile(self, account):
+        profile = account["storage"].get_profile()
+        account["free_bytes"] = self._free_space(profile)
+        account["profile_checked"] = time.time()
+        if account["free_bytes"] is None and not account["quota_warned"]:
+            print(
+                f"Warning: storage account {account['index']} profile has no quota fields "
+                f"({', '.join(sorted(profile))}); uploads to it are routed by load and errors only"
+            )
+            account["quota_warned"] = True
+        return profile
+
+    def refresh_quota(self, account):
+        try:
+            self.fetch_profile(account)
+        except Exception:
+            account["profile_checked"] = time.time()
+
+    def acquire(self, file_size):
+        for account in self.accounts:
+            if account["enabled"]:
+                account["storage"].ensure_access_token()
+            if account["enabled"] and time.time() - account["profile_checked"] > self.PROFILE_TTL:
+                self.refresh_quota(account)
+        
+        with self.lock:
+            candidates = [
+                account for account in self.accounts
+                if account["enabled"] and (account["free_bytes"] is None or account["free_bytes"] >= file_size)
+            ]
+            if not candidates:
+                raise Exception("No storage account has enough free space")
+            
+            account = min(candidates, key=lambda a: (
+                round(a["error_rate"], 1),
+                a["active_uploads"],
+                -(a["free_bytes"] or 0),
+            ))
+            account["active_uploads"] += 1
+            if account["free_bytes"] is not None:
+                account["free_bytes"] -= file_size
+            return account
+
+    def release(self, account, success):
+        with self.lock:
+            account["active_uploads"] -= 1
+            account["error_rate"] = account["error_rate"] * 0.8 + (0.0 if success else 0.2)
+
+    def tag_id(self, account, obj_id):
+        if account["index"] == 0:
+            return str(obj_id)
+        return f"{account['index']}:{obj_id}"
+
+    def resolve_id(self, tagged_id):
+        tagged_id = str(tagged_id)
+        if ":" in tagged_id:
+            index, obj_id = tagged_id.split(":", 1)
+            index = int(index)
+        else:
+            index, obj_id = 0, tagged_id
+        
+        if index >= len(self.accounts):
+            raise Exception(f"Unknown storage account in file ID `{tagged_id}`")
+        return self.accounts[index]["storage"], int(obj_id)
+
+    def list_objects(self):
+        count = 0
+        results = []
+        for account in self.accounts:
+            if not account["enabled"]:
+                continue
+            files = account["storage"].list_objects()
+            count += files.get('count', 0)
+            for file_obj in files.get('results', []):
+                file_obj['tagged_id'] = self.tag_id(account, file_obj['id'])
+                results.append(file_obj)
+        return {"count": count, "results": results}
+
+    def list_all_objects(self, page_size=1000):
+        results = []
+        for account in self.accounts:
+            if not account["enabled"]:
+                continue
+            offset = 0
+            while True:
+                files = account["storage"].list_objects(limit=page_size, offset=offset)
+                page = files.get('results', [])
+                for file_obj in page:
+                    file_obj['tagged_id'] = self.tag_id(account, file_obj['id'])
+                    results.append(file_obj)
+                offset += len(page)
+                if not page or not files.get('next') or offset >= files.get('count', 0):
+                    break
+        return results
+
+class FileIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.trigrams = {}
+        self.built_at = 0
+        self.rebuilding = False
+        self.pending_changes = []
+
+    def _trigrams(self, text):
+        padded = f"  {text.lower()} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _tokens(self, text):
+        return [token for token in re.split(r'[\W_]+', text.lower()) if token]
+
+    def _add(self, file_obj):
+        file_id = file_obj['tagged_id']
+        self.files[file_id] = file_obj
+        for gram in self._trigrams(file_obj['name']):
+            self.trigrams.setdefault(gram, set()).add(file_id)
+
+    def _remove(self, file_id):
+        file_obj = self.files.pop(file_id, None)
+        if not file_obj:
+            return
+        for gram in self._trigrams(file_obj['name']):
+            ids = self.trigrams.get(gram)
+            if ids:
+                ids.discard(file_id)
+                if not ids:
+                    del self.trigrams[gram]
+
+    def begin_rebuild(self):
+        with self.lock:
+            self.rebuilding = True
+            self.pending_changes = []
+
+    def abort_rebuild(self):
+        with self.lock:
+            self.rebuilding = False
+            self.pending_changes = []
+
+    def rebuild(self, files):
+        with self.lock:
+            self.files = {}
+            self.trigrams = {}
+            for file_obj in files:
+                self._add(file_obj)
+            for action, value in self.pending_changes:
+                if action == "add":
+                    self._remove(value['tagged_id'])
+                    self._add(value)
+                else:
+                    self._remove(value)
+            self.rebuilding = False
+            self.pending_changes = []
+            self.built_at = time.time()
+
+    def add(self, file_id, name, size):
+        file_obj = {"tagged_id": file_id, "name": name, "size": size}
+        with self.lock:
+            self._remove(file_id)
+            self._add(file_obj)
+            if self.rebuilding:
+                self.pending_changes.append(("add", file_obj))
+
+    def remove(self, file_id):
+        with self.lock:
+            self._remove(file_id)
+            if self.rebuilding:
+                self.pending_changes.append(("remove", file_id))
+
+    def search(self, query):
+        query = query.strip().lower()
+        grams = self._trigrams(query)
+        tokens = self._tokens(query)
+        if not grams:
+            return []
+        
+        with self.lock:
+            hits = {}
+            for gram in grams:
+                for file_id in self.trigrams.get(gram, ()):
+                    hits[file_id] = hits.get(file_id, 0) + 1
+            
+            ranked = []
+            for file_id, count in hits.items():
+                file_obj = self.files[file_id]
+                name = file_obj['name'].lower()
+                score = count / len(grams)
+                if query in name:
+                    score += 1
+                    if name.startswith(query):
+                        score += 0.5
+                name_tokens = self._tokens(name)
+                score += 0.25 * sum(
+                    1 for token in tokens if any(part.startswith(token) for part in name_tokens)
+                )
+                if score >= 0.6:
+                    ranked.append((score, file_obj))
+        
+        ranked.sort(key=lambda item: (-item[0], item[1]['name'].lower()))
+        return [file_obj for score, file_obj in ranked]
+
+class StagingArea:
+    STAGED_NAME = re.compile(r"^-?\d+_\d+(\.temp)?$")
+
+    def __init__(self, directory="downloads", quota_bytes=0, min_free_bytes=0):
+        self.directory = Path(directory).resolve()
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self.reserved_bytes = 0
+        self._condition = asyncio.Condition()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def staged_files(self):
+        for path in self.directory.iterdir():
+            if self.STAGED_NAME.match(path.name) and path.is_file():
+                yield path
+
+    def sweep_orphans(self):
+        removed = 0
+        freed = 0
+        for path in self.staged_files():
+            try:
+                size = path.stat().st_size
+                path.unlink()
+                removed += 1
+                freed += size
+            except Exception:
+                pass
+        return removed, freed
+
+    def path_for(self, source):
+        return self.directory / f"{source['chat_id']}_{source['message_id']}"
+
+    def can_fit(self, size):
+        return not self.quota_bytes or size <= self.quota_bytes
+
+    def staged_bytes(self):
+        total = 0
+        for path in self.staged_files():
+            try:
+                stat = path.stat()
+                total += stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+            except Exception:
+                pass
+        return total
+
+    def has_room(self, size):
+        if self.quota_bytes and self.reserved_bytes + size > self.quota_bytes:
+            return False
+        unwritten = max(0, self.reserved_bytes - self.staged_bytes())
+        free = shutil.disk_usage(self.directory).free
+        return free - unwritten - size >= self.min_free_bytes
+
+    async def reserve(self, size):
+        async with self._condition:
+            while not self.has_room(size):
+                if self.reserved_bytes == 0:
+                    raise Exception("Not enough disk space for this file")
+                await self._condition.wait()
+            self.reserved_bytes += size
+
+    async def release(self, size):
+        async with self._condition:
+            self.reserved_bytes = max(0, self.reserved_bytes - size)
+            self._condition.notify_all()
+
+class ParallelDownloader:
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, stream, connections=4):
+        self.stream = stream
+        self.connections = connections
+
+    def _write(self, f, position, data):
+        f.seek(position)
+        f.write(data)
+
+    async def _fetch_range(self, file_path, first_chunk, chunk_count):
+        position = first_chunk * self.CHUNK_SIZE
+        written = 0
+        with open(file_path, 'r+b') as f:
+            async with aclosing(self.stream(first_chunk, chunk_count)) as stream:
+                async for chunk in stream:
+                    await asyncio.to_thread(self._write, f, position, chunk)
+                    position += len(chunk)
+                    written += len(chunk)
+        return written
+
+    async def download(self, file_path, file_size):
+        total_chunks = max(1, (file_size + self.CHUNK_SIZE - 1) // self.CHUNK_SIZE)
+        connections = max(1, min(self.connections, total_chunks))
+        chunks_per_range = (total_chunks + connections - 1) // connections
+        
+        with open(file_path, 'wb') as f:
+            f.truncate(file_size)
+        
+        ranges = [
+            (first, min(chunks_per_range, total_chunks - first))
+            for first in range(0, total_chunks, chunks_per_range)
+        ]
+        tasks = [
+            asyncio.create_task(self._fetch_range(file_path, first, count))
+            for first, count in ranges
+        ]
+        try:
+            written = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        if sum(written) != file_size:
+            raise Exception(f"Download incomplete: got {sum(written)} of {file_size} bytes")
+        return file_path
+
+class JobQueue:
+    def __init__(self, path="jobs.db", lease_seconds=120):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    progress_message_id INTEGER NOT NULL,
+                    user_id INTEGER,
+                    file_id TEXT,
+                    file_name TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    worker TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    progress_seq INTEGER NOT NULL DEFAULT 0,
+                    reported_seq INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'file_id' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN file_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_unreported ON jobs (id) WHERE progress_seq > reported_seq")
+            conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, chat_id, message_id, progress_message_id, user_id, file_id, file_name, file_size):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                """INSERT INTO jobs (chat_id, message_id, progress_message_id, user_id, file_id, file_name, file_size, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (chat_id, message_id, progress_message_id, user_id, file_id, file_name, file_size, now, now)
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    """SELECT * FROM jobs
+                       WHERE status = 'queued' OR (status = 'running' AND updated_at < ?)
+                       ORDER BY id LIMIT 1""",
+                    (time.time() - self.lease_seconds,)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, updated_at = ? WHERE id = ?",
+                        (worker, time.time(), row['id'])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            
+            if not row:
+                return None
+            job = dict(row)
+            job['status'] = 'running'
+            job['worker'] = worker
+            return job
+
+    def heartbeat(self, job_id, worker):
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker)
+            )
+            return cursor.rowcount > 0
+
+    def report_progress(self, job_id, worker, text):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """UPDATE jobs SET progress = ?, progress_seq = progress_seq + 1, updated_at = ?
+                   WHERE id = ? AND worker = ? AND status = 'running'""",
+                (text, time.time(), job_id, worker)
+            )
+
+    def finish(self, job_id, worker, status, result):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """UPDATE jobs SET status = ?, result = ?, progress_seq = progress_seq + 1, updated_at = ?
+                   WHERE id = ? AND worker = ? AND status = 'running'""",
+                (status, json.dumps(result), time.time(), job_id, worker)
+            )
+
+    def requeue(self, job_id, worker, text):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """UPDATE jobs SET status = 'queued', worker = NULL, progress = ?, progress_seq = progress_seq + 1, updated_at = ?
+                   WHERE id = ? AND worker = ? AND status = 'running'""",
+                (text, time.time(), job_id, worker)
+            )
+
+    def requeue_worker_jobs(self, worker):
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                """UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ?
+                   WHERE status = 'running' AND (worker = ? OR worker LIKE ?)""",
+                (time.time(), worker, f"{worker}.%")
+            )
+            return cursor.rowcount
+
+    def pending_updates(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE progress_seq > reported_seq ORDER BY id"
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def mark_reported(self, job_id, seq):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE id = ? AND progress_seq = ? AND status IN ('done', 'failed')",
+                (job_id, seq)
+            )
+            conn.execute("UPDATE jobs SET reported_seq = ? WHERE id = ?", (seq, job_id))
+
+    def set_setting(self, key, value):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value))
+            )
+
+    def get_setting(self, key, default=None):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+            return json.loads(row['value']) if row else default
+
+class UploadInterrupted(Exception):
+    pass
+
 class abrehamrahiBot:
     def __init__(self):
         self.setup_environment()
         
-        self.uploader = abrehamrahiStorage(refresh_token=self.refresh_token)
+        self.storage_pool = StoragePool(self.refresh_tokens, pool_size=self.http_pool_size)
         
-        if not self.uploader.get_access_token_from_refresh(self.refresh_token):
+        active_accounts = self.storage_pool.authenticate(reuse_cached=self.reuse_cached_token)
+        if not active_accounts:
             print("Failed to get access token")
             exit(1)
+        if len(active_accounts) < len(self.storage_pool.accounts):
+            print(f"Warning: only {len(active_accounts)}/{len(self.storage_pool.accounts)} storage accounts authenticated")
         
-        self.app = Client(
-            "abrehamrahi_bot",
-            api_id=self.api_id,
-            api_hash=self.api_hash,
-            bot_token=self.bot_token,
-            in_memory=True,
-            workers=20,
+        self.uploader = active_accounts[0]["storage"]
+        
+        self.accepting_uploads = True
+        self.active_uploads = {}
+        self.file_index = FileIndex()
+        self.index_refresh_lock = asyncio.Lock()
+        self.find_queries = {}
+        self.bandwidth = BandwidthLimiter(
+            global_rate=self.global_upload_kbps * 1024,
+            user_rate=self.user_upload_kbps * 1024,
+            shares=self.worker_count if self.mode == "worker" else 1,
         )
+        self.worker_processes = []
+        self.hash_pool = None
+        if self.hash_workers > 0 and self.mode != "front":
+            self.hash_pool = create_hash_pool(self.hash_workers)
+        
+        if self.mode != "standalone":
+            self.job_queue = JobQueue(self.queue_db, lease_seconds=self.job_lease_seconds)
+            self.load_bandwidth_settings()
+        
+        if self.mode != "front":
+            staging_dir = self.staging_dir
+            if self.mode == "worker":
+                staging_dir = os.path.join(staging_dir, f"worker_{self.worker_id}")
+            self.staging = StagingArea(
+                staging_dir,
+                quota_bytes=self.staging_quota_mb * 1024 * 1024,
+                min_free_bytes=self.staging_min_free_mb * 1024 * 1024,
+            )
+            removed, freed = self.staging.sweep_orphans()
+            if removed:
+                print(f"Removed {removed} orphaned staging files ({self.uploader._format_size(freed)})")
+        
+        concurrent_downloads = self.worker_concurrency if self.mode == "worker" else self.max_concurrent_downloads
+        transmissions = max(1, self.download_connections) * concurrent_downloads
         
-        self.setup_handlers()
+        if self.mode == "worker":
+            self.app = Client(
+                f"abrehamrahi_worker_{self.worker_id}",
+                api_id=self.api_id,
+                api_hash=self.api_hash,
+                bot_token=self.bot_token,
+                in_memory=not self.persistent_session,
+                workdir=self.session_dir,
+                no_updates=True,
+                max_concurrent_transmissions=transmissions,
+            )
+        else:
+            self.app = Client(
+                "abrehamrahi_bot",
+                api_id=self.api_id,
+                api_hash=self.api_hash,
+                bot_token=self.bot_token,
+                in_memory=not self.persistent_session,
+                workdir=self.session_dir,
+                workers=20,
+                max_concurrent_transmissions=transmissions,
+            )
+            self.setup_handlers()
 
     def setup_environment(self):
         env_file = ".env"
@@ -291,9 +1022,41 @@ class abrehamrahiBot:
         self.api_id = os.getenv('API_ID')
         self.api_hash = os.getenv('API_HASH')
         self.bot_token = os.getenv('BOT_TOKEN')
-        self.refresh_token = os.getenv('REFRESH_TOKEN')
+        self.refresh_tokens = [
+            token.strip()
+            for token in (os.getenv('REFRESH_TOKENS') or os.getenv('REFRESH_TOKEN') or '').split(',')
+            if token.strip()
+        ]
+        self.http_pool_size = int(os.getenv('HTTP_POOL_SIZE', '10'))
+        self.persistent_session = os.getenv('PERSISTENT_SESSION', '1') == '1'
+        self.session_dir = os.getenv('SESSION_DIR', '.')
+        self.reuse_cached_token = os.getenv('REUSE_CACHED_TOKEN', '1') == '1'
+        self.index_refresh_minutes = int(os.getenv('INDEX_REFRESH_MINUTES', '30'))
+        self.global_upload_kbps = int(os.getenv('GLOBAL_UPLOAD_KBPS', '0'))
+        self.user_upload_kbps = int(os.getenv('USER_UPLOAD_KBPS', '0'))
+        self.admin_ids = {int(uid) for uid in os.getenv('ADMIN_IDS', '').split(',') if uid.strip()}
+        self.drain_timeout = float(os.getenv('DRAIN_TIMEOUT', '300'))
+        self.interrupted_file = os.getenv('INTERRUPTED_UPLOADS_FILE', 'interrupted_uploads.json')
+        self.staging_dir = os.getenv('STAGING_DIR', 'downloads')
+        self.staging_quota_mb = int(os.getenv('STAGING_QUOTA_MB', '0'))
+        self.staging_min_free_mb = int(os.getenv('STAGING_MIN_FREE_MB', '512'))
+        self.mode = os.getenv('BOT_MODE', 'standalone').lower()
+        self.queue_db = os.getenv('QUEUE_DB', 'jobs.db')
+        self.worker_count = int(os.getenv('WORKER_PROCESSES', '0'))
+        self.worker_concurrency = int(os.getenv('WORKER_CONCURRENCY', '4'))
+        self.worker_id = os.getenv('WORKER_ID', '0')
+        self.job_lease_seconds = int(os.getenv('JOB_LEASE_SECONDS', '120'))
+        self.hash_workers = int(os.getenv('HASH_WORKERS', '0'))
+        self.download_connections = int(os.getenv('DOWNLOAD_CONNECTIONS', '4'))
+        self.max_concurrent_downloads = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '4'))
+        self.small_file_max_kb = int(os.getenv('SMALL_FILE_MAX_KB', '2048'))
+        self.parallel_download_min_mb = int(os.getenv('PARALLEL_DOWNLOAD_MIN_MB', '20'))
         
-        if not all([self.api_id, self.api_hash, self.bot_token, self.refresh_token]):
+        if self.mode not in ("standalone", "front", "worker"):
+            print("BOT_MODE must be standalone, front or worker")
+            exit(1)
+        
+        if not all([self.api_id, self.api_hash, self.bot_token, self.refresh_tokens]):
             print("Missing required environment variables")
             exit(1)
         
@@ -343,20 +1106,7 @@ REFRESH_TOKEN={refresh_token}
         @self.app.on_message(filters.command("profile"))
         async def profile_command(client, message: Message):
             try:
-                profile = await asyncio.to_thread(self.uploader.get_profile)
-                
-                profile_text = f"""
-User Profile
-
-Name: {profile.get('name', 'N/A')}
-Phone: {profile.get('phone', 'N/A')}
-ID: `{profile.get('id', 'N/A')}`
-Country: {profile.get('country', 'N/A')}
-Language: {profile.get('language', 'N/A')}
-Balance: {profile.get('withdrawable_balance', 0)}
-
-Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).strftime('%Y-%m-%d %H:%M')}
-                """
+                profile_text = await self.get_profile_text()
                 
                 keyboard = InlineKeyboardMarkup([
                     [InlineKeyboardButton("Back to Main", callback_data="main_menu")]
@@ -385,6 +1135,64 @@ Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).st
             except Exception as e:
                 await message.reply_text(f"Error deleting file: {str(e)}")
 
+        @self.app.on_message(filters.command("find"))
+        async def find_command(client, message: Message):
+            args = message.text.split(maxsplit=1)
+            if len(args) < 2 or not args[1].strip():
+                await message.reply_text("Please provide a search query:\n`/find <query>`")
+                return
+            
+            self.find_queries[message.chat.id] = args[1].strip()
+            await self.show_search_results(message)
+
+        @self.app.on_message(filters.command("ratelimit"))
+        async def ratelimit_command(client, message: Message):
+            if not message.from_user or message.from_user.id not in self.admin_ids:
+                await message.reply_text("This command is only available to bot admins.")
+                return
+            
+            usage_text = "Usage:\n`/ratelimit global <KB/s>`\n`/ratelimit user <KB/s>`\n`/ratelimit user <user_id> <KB/s>`\n\nUse 0 for unlimited."
+            
+            try:
+                args = message.text.split()[1:]
+                valid = (
+                    not args
+                    or (len(args) == 2 and args[0] in ("global", "user"))
+                    or (len(args) == 3 and args[0] == "user")
+                )
+                if not valid:
+                    await message.reply_text(usage_text)
+                    return
+                
+                if args:
+                    rate = int(args[-1])
+                    if rate < 0:
+                        await message.reply_text(usage_text)
+                        return
+                    
+                    if args[0] == "global":
+                        self.bandwidth.set_global_rate(rate * 1024)
+                    elif len(args) == 2:
+                        self.bandwidth.set_user_rate(rate * 1024)
+                    else:
+                        self.bandwidth.set_user_rate(rate * 1024, int(args[1]))
+                
+                settings = self.bandwidth.to_dict()
+                if self.mode == "front":
+                    await asyncio.to_thread(self.job_queue.set_setting, "bandwidth", settings)
+                
+                def rate_text(rate):
+                    return f"{self.uploader._format_size(rate)}/s" if rate else "unlimited"
+                
+                limits_text = f"Upload Rate Limits\n\nGlobal: {rate_text(settings['global_rate'])}\nPer user: {rate_text(settings['user_rate'])}\n"
+                for uid, rate in settings['user_overrides'].items():
+                    limits_text += f"User `{uid}`: {rate_text(rate)}\n"
+                
+                await message.reply_text(limits_text)
+                
+            except ValueError:
+                await message.reply_text("Rates and user IDs must be numbers.")
+
         @self.app.on_message(filters.command("help"))
         async def help_command(client, message: Message):
             keyboard = InlineKeyboardMarkup([
@@ -403,6 +1211,7 @@ Main Commands:
 • /start → Main menu
 • /list → View files
 • /delete <file_id> → Delete file
+• /find <query> → Search files
 • /profile → User profile
 • /help → This help
 
@@ -447,6 +1256,14 @@ Features:
             elif data == "manage_files":
                 await self.show_management_options(callback_query.message, callback_query)
             
+            elif data.startswith("find_page_"):
+                page = int(data.replace("find_page_", ""))
+                await self.show_search_results(callback_query.message, callback_query, page)
+            
+            elif data.startswith("link_"):
+                file_id = data.replace("link_", "")
+                await self.show_public_link(callback_query.message, file_id, callback_query)
+            
             elif data.startswith("delete_"):
                 file_id = data.replace("delete_", "")
                 await self.delete_file(callback_query.message, file_id, callback_query)
@@ -461,20 +1278,7 @@ Features:
             
             elif data == "my_profile":
                 try:
-                    profile = await asyncio.to_thread(self.uploader.get_profile)
-                    
-                    profile_text = f"""
-User Profile
-
-Name: {profile.get('name', 'N/A')}
-Phone: {profile.get('phone', 'N/A')}
-ID: `{profile.get('id', 'N/A')}`
-Country: {profile.get('country', 'N/A')}
-Language: {profile.get('language', 'N/A')}
-Balance: {profile.get('withdrawable_balance', 0)}
-
-Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).strftime('%Y-%m-%d %H:%M')}
-                    """
+                    profile_text = await self.get_profile_text()
                     
                     keyboard = InlineKeyboardMarkup([
                         [InlineKeyboardButton("Back to Main", callback_data="main_menu")]
@@ -501,149 +1305,417 @@ Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).st
 
         @self.app.on_message(filters.document | filters.video | filters.audio)
         async def handle_file_upload(client, message: Message):
-            progress_msg = await message.reply_text("Preparing upload...")
-            file_path = None
-            last_update_time = time.time()
+            if not self.accepting_uploads:
+                await message.reply_text("Bot is restarting, please send the file again in a minute.")
+                return
             
-            try:
-                if message.document:
-                    file = message.document
-                    file_name = file.file_name
-                elif message.video:
-                    file = message.video
-                    file_name = f"video_{file.file_id}.mp4"
-                elif message.audio:
-                    file = message.audio
-                    file_name = f"audio_{file.file_id}.mp3" if not file.file_name else file.file_name
-                else:
-                    await progress_msg.edit_text("Unsupported file format!")
-                    return
+            file_name, file_size, file_id = self.get_file_info(message)
+            if not file_name:
+                await message.reply_text("Unsupported file format!")
+                return
+            
+            source = self.upload_source(message)
+            
+            if file_size and file_size <= self.small_file_max_kb * 1024:
+                try:
+                    result = await self.run_upload(self.process_small_upload(source, file_name, file_size))
+                    self.record_upload(result)
+                    text, keyboard = self.upload_success_view(result)
+                    await message.reply_text(text, reply_markup=keyboard, disable_web_page_preview=True)
 
-                file_size = file.file_size
+                except UploadInterrupted:
+                    try:
+                        await message.reply_text(
+                            "Upload Interrupted\n\nThe bot is restarting, please send the file again."
+                        )
+                    except Exception:
+                        self.record_interrupted_upload(source, file_name)
 
+                except Exception as e:
+                    text, keyboard = self.upload_error_view(str(e))
+                    await message.reply_text(text, reply_markup=keyboard)
+                return
+            
+            progress_msg = await message.reply_text("Preparing upload...")
+            
+            if self.mode == "front":
+                await asyncio.to_thread(
+                    self.job_queue.enqueue,
+                    message.chat.id,
+                    message.id,
+                    progress_msg.id,
+                    source['user_id'],
+                    file_id,
+                    file_name,
+                    file_size,
+                )
                 await progress_msg.edit_text(
-                    f"Preparing Upload\n\nFile: `{file_name}`\nSize: {self.uploader._format_size(file_size)}\nPlease wait..."
+                    f"Queued\n\nFile: `{file_name}`\nSize: {self.uploader._format_size(file_size)}\nWaiting for a free worker..."
                 )
+                return
+            
+            async def report(text):
+                await progress_msg.edit_text(text)
+            
+            try:
+                result = await self.run_upload(self.process_upload(source, file_name, file_size, report))
+                self.record_upload(result)
+                text, keyboard = self.upload_success_view(result)
+                await progress_msg.edit_text(text, reply_markup=keyboard, disable_web_page_preview=True)
 
-                download_start = time.time()
-                download_path = await message.download(in_memory=False)
-                file_path = Path(download_path)
-                download_time = time.time() - download_start
+            except UploadInterrupted:
+                try:
+                    await progress_msg.edit_text(
+                        "Upload Interrupted\n\nThe bot is restarting, please send the file again."
+                    )
+                except Exception:
+                    self.record_interrupted_upload(source, file_name)
 
-                await progress_msg.edit_text(
-                    f"Download Complete\n\nFile: `{file_name}`\nSize: {self.uploader._format_size(file_size)}\nDownload time: {download_time:.1f}s\nStarting upload..."
-                )
+            except Exception as e:
+                text, keyboard = self.upload_error_view(str(e))
+                await progress_msg.edit_text(text, reply_markup=keyboard)
 
-                upload_data = await asyncio.to_thread(self.uploader.start_upload, file_size, file_name)
-                
-                upload_id = upload_data.get('upload_id')
-                key = upload_data.get('key')
-                signed_urls = upload_data.get('signed_urls', [])
-                actual_chunk_size = upload_data.get('chunk_size', 5242880)
+        self.handle_file_upload = handle_file_upload
 
-                if not upload_id or not key:
-                    raise Exception("Server error")
+    def get_file_info(self, message):
+        if message.document:
+            file = message.document
+            file_name = file.file_name
+        elif message.video:
+            file = message.video
+            file_name = f"video_{file.file_id}.mp4"
+        elif message.audio:
+            file = message.audio
+            file_name = f"audio_{file.file_id}.mp3" if not file.file_name else file.file_name
+        else:
+            return None, 0, None
+        return file_name, file.file_size, file.file_id
 
-                parts = []
-                total_parts = (file_size + actual_chunk_size - 1) // actual_chunk_size
+    def upload_source(self, message):
+        return {
+            "media": message,
+            "chat_id": message.chat.id,
+            "message_id": message.id,
+            "user_id": message.from_user.id if message.from_user else message.chat.id,
+        }
 
-                upload_start_time = time.time()
-                with open(file_path, 'rb') as f:
-                    for part_number in range(1, total_parts + 1):
-                        start_pos = (part_number - 1) * actual_chunk_size
-                        end_pos = min(part_number * actual_chunk_size, file_size)
-                        chunk_size_actual = end_pos - start_pos
+    def upload_success_view(self, result):
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("Open Link", url=result['download_url'])],
+            [InlineKeyboardButton("Manage Files", callback_data="manage_files")],
+            [InlineKeyboardButton("View Files", callback_data="list_files")],
+            [InlineKeyboardButton("Upload New File", callback_data="upload_help")]
+        ])
+        text = f"Upload Successful!\n\nFile: `{result['file_name']}`\nSize: {self.uploader._format_size(result['file_size'])}\nDownload URL: `{result['download_url']}`\nFile ID: `{result['file_id']}`\nTotal Time: {result['total_time']:.1f}s"
+        if result.get('sha256'):
+            text += f"\nSHA-256: `{result['sha256']}`"
+        return text, keyboard
 
-                        f.seek(start_pos)
-                        chunk = f.read(chunk_size_actual)
+    def upload_error_view(self, error):
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("Try Again", callback_data="upload_help")],
+            [InlineKeyboardButton("Main Menu", callback_data="main_menu")]
+        ])
+        text = f"Upload Error\n\nError: {error}\nPlease try again!"
+        return text, keyboard
 
-                        if part_number - 1 < len(signed_urls):
-                            signed_url = signed_urls[part_number - 1]
-                        else:
-                            raise Exception("Upload URL error")
-
-                        etag = await asyncio.to_thread(self.uploader.upload_file_part, signed_url, chunk, part_number)
-
-                        parts.append({
-                            "part_number": part_number,
-                            "size": len(chunk),
-                            "etag": etag
-                        })
-
-                        current_time = time.time()
-                        if current_time - last_update_time >= 3 or part_number == total_parts:
-                            elapsed_time = current_time - upload_start_time
-                            progress_percent = (part_number / total_parts) * 100
-                            progress_bar = "🟩" * int(progress_percent / 10) + "⬜" * (10 - int(progress_percent / 10))
-                            
-                            uploaded_bytes = part_number * actual_chunk_size
-                            if uploaded_bytes > file_size:
-                                uploaded_bytes = file_size
-                            
-                            if elapsed_time > 0:
-                                speed = uploaded_bytes / elapsed_time
-                                remaining_bytes = file_size - uploaded_bytes
-                                eta = remaining_bytes / speed if speed > 0 else 0
-                            else:
-                                speed = 0
-                                eta = 0
-
-                            try:
-                                await progress_msg.edit_text(
-                                    f"Uploading...\n\nFile: `{file_name}`\nProgress: {progress_percent:.1f}%\n{progress_bar}\nPart: {part_number}/{total_parts}\nUploaded: {self.uploader._format_size(uploaded_bytes)} / {self.uploader._format_size(file_size)}\nSpeed: {self.uploader._format_size(speed)}/s\nETA: {eta:.0f}s"
-                                )
-                                last_update_time = current_time
-                            except Exception:
-                                pass
-
-                await progress_msg.edit_text("Upload complete! Creating download link...")
-                result = await asyncio.to_thread(self.uploader.complete_upload, upload_id, key, parts, file_name, False)
-                
-                file_id = result.get('id')
-                if not file_id:
-                    raise Exception("File ID error")
+    def upload_throttle(self, user_id):
+        return lambda amount: self.bandwidth.throttle(user_id, amount)
 
-                public_link_data = await asyncio.to_thread(self.uploader.create_public_link, file_id)
-                download_url = public_link_data.get('link', 'N/A')
-                
-                total_time = time.time() - download_start
+    async def process_small_upload(self, source, file_name, file_size):
+        account = None
+        storage_failed = False
+        start_time = time.time()
+        
+        task = asyncio.current_task()
+        upload_state = {
+            "file_name": file_name,
+            "finished": asyncio.Event(),
+        }
+        self.active_uploads[task] = upload_state
+        download = asyncio.create_task(self.app.download_media(source['media'], in_memory=True))
+        
+        try:
+            account = await asyncio.to_thread(self.storage_pool.acquire, file_size)
+            uploader = account["storage"]
+            throttle = self.upload_throttle(source['user_id'])
+            
+            try:
+                upload_data = await asyncio.to_thread(uploader.start_upload, file_size, file_name)
+            except Exception:
+                storage_failed = True
+                raise
+            
+            upload_id = upload_data.get('upload_id')
+            key = upload_data.get('key')
+            signed_urls = upload_data.get('signed_urls', [])
+            actual_chunk_size = upload_data.get('chunk_size', 5242880)
+
+            if not upload_id or not key:
+                storage_failed = True
+                raise Exception("Server error")
+            
+            try:
+                data = (await download).getvalue()
+            except Exception as e:
+                print(f"Download of {file_name} failed ({e}), multipart upload {upload_id} ({key}) left open on account {account['index']}")
+                raise
+
+            try:
+                chunks = [data[pos:pos + actual_chunk_size] for pos in range(0, len(data), actual_chunk_size)]
+                if len(chunks) > len(signed_urls):
+                    raise Exception("Upload URL error")
+
+                loop = asyncio.get_running_loop()
+                uploads = asyncio.gather(*(
+                    asyncio.to_thread(uploader.upload_file_part, signed_urls[i], chunk, i + 1, throttle)
+                    for i, chunk in enumerate(chunks)
+                ))
+                if self.hash_pool:
+                    hashes = asyncio.gather(*(
+                        loop.run_in_executor(self.hash_pool, hash_part, chunk) for chunk in chunks
+                    ))
+                    etags, part_hashes = await asyncio.gather(uploads, hashes)
+                else:
+                    etags, part_hashes = await uploads, None
                 
-                success_keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Open Link", url=download_url)],
-                    [InlineKeyboardButton("Manage Files", callback_data="manage_files")],
-                    [InlineKeyboardButton("View Files", callback_data="list_files")],
-                    [InlineKeyboardButton("Upload New File", callback_data="upload_help")]
-                ])
+                parts = []
+                for i, (chunk, etag) in enumerate(zip(chunks, etags)):
+                    part = {"part_number": i + 1, "size": len(chunk), "etag": etag}
+                    if part_hashes:
+                        md5, sha256 = part_hashes[i]
+                        if len(etag) == 32 and etag.lower() != md5:
+                            raise Exception(f"Checksum mismatch on part {i + 1}")
+                        part["md5"] = md5
+                        part["sha256"] = sha256
+                    parts.append(part)
+
+                result = await asyncio.to_thread(uploader.complete_upload, upload_id, key, parts, file_name, False)
                 
-                await progress_msg.edit_text(
-                    f"Upload Successful!\n\nFile: `{file_name}`\nSize: {self.uploader._format_size(file_size)}\nDownload URL: `{download_url}`\nFile ID: `{file_id}`\nTotal Time: {total_time:.1f}s",
-                    reply_markup=success_keyboard,
-                    disable_web_page_preview=True
+                obj_id = result.get('id')
+                if not obj_id:
+                    raise Exception("File ID error")
+                file_id = self.storage_pool.tag_id(account, obj_id)
+
+                public_link_data = await asyncio.to_thread(uploader.create_public_link, obj_id)
+            except Exception:
+                storage_failed = True
+                raise
+            
+            result = {
+                "file_name": file_name,
+                "file_size": file_size,
+                "file_id": file_id,
+                "download_url": public_link_data.get('link', 'N/A'),
+                "total_time": time.time() - start_time,
+            }
+            if part_hashes:
+                if len(part_hashes) == 1:
+                    result["sha256"] = part_hashes[0][1]
+                else:
+                    result["sha256"] = (await loop.run_in_executor(self.hash_pool, hash_part, data))[1]
+            return result
+
+        finally:
+            download.cancel()
+            await asyncio.gather(download, return_exceptions=True)
+            self.active_uploads.pop(task, None)
+            upload_state["finished"].set()
+            if account:
+                self.storage_pool.release(account, not storage_failed)
+
+    async def process_upload(self, source, file_name, file_size, report):
+        file_path = None
+        file_hash = None
+        reserved_size = 0
+        account = None
+        upload_succeeded = False
+        last_update_time = time.time()
+        
+        task = asyncio.current_task()
+        upload_state = {
+            "file_name": file_name,
+            "finished": asyncio.Event(),
+        }
+        self.active_uploads[task] = upload_state
+        
+        try:
+            if not self.staging.can_fit(file_size):
+                raise Exception(f"File is larger than the staging quota ({self.uploader._format_size(self.staging.quota_bytes)})")
+
+            if not self.staging.has_room(file_size):
+                await report(
+                    f"Queued\n\nFile: `{file_name}`\nSize: {self.uploader._format_size(file_size)}\nWaiting for free disk space..."
                 )
+            await self.staging.reserve(file_size)
+            reserved_size = file_size
+            throttle = self.upload_throttle(source['user_id'])
 
-            except Exception as e:
-                error_keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Try Again", callback_data="upload_help")],
-                    [InlineKeyboardButton("Main Menu", callback_data="main_menu")]
-                ])
-                
-                await progress_msg.edit_text(
-                    f"Upload Error\n\nError: {str(e)}\nPlease try again!",
-                    reply_markup=error_keyboard
+            await report(
+                f"Preparing Upload\n\nFile: `{file_name}`\nSize: {self.uploader._format_size(file_size)}\nPlease wait..."
+            )
+
+            download_start = time.time()
+            file_path = self.staging.path_for(source)
+            if self.download_connections > 1 and file_size >= self.parallel_download_min_mb * 1024 * 1024:
+                downloader = ParallelDownloader(
+                    lambda offset, limit: self.app.stream_media(source['media'], limit=limit, offset=offset),
+                    connections=self.download_connections,
                 )
+                await downloader.download(file_path, file_size)
+            else:
+                download_path = await self.app.download_media(source['media'], file_name=str(file_path))
+                file_path = Path(download_path)
+            download_time = time.time() - download_start
+
+            await report(
+                f"Download Complete\n\nFile: `{file_name}`\nSize: {self.uploader._format_size(file_size)}\nDownload time: {download_time:.1f}s\nStarting upload..."
+            )
+
+            loop = asyncio.get_running_loop()
+            if self.hash_pool:
+                file_hash = loop.run_in_executor(self.hash_pool, hash_file, str(file_path))
+
+            account = await asyncio.to_thread(self.storage_pool.acquire, file_size)
+            uploader = account["storage"]
+            upload_data = await asyncio.to_thread(uploader.start_upload, file_size, file_name)
             
-            finally:
-                if file_path and os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except Exception:
-                        pass
+            upload_id = upload_data.get('upload_id')
+            key = upload_data.get('key')
+            signed_urls = upload_data.get('signed_urls', [])
+            actual_chunk_size = upload_data.get('chunk_size', 5242880)
 
-        self.handle_file_upload = handle_file_upload
+            if not upload_id or not key:
+                raise Exception("Server error")
+
+            parts = []
+            total_parts = (file_size + actual_chunk_size - 1) // actual_chunk_size
+
+            upload_start_time = time.time()
+            with open(file_path, 'rb') as f:
+                for part_number in range(1, total_parts + 1):
+                    start_pos = (part_number - 1) * actual_chunk_size
+                    end_pos = min(part_number * actual_chunk_size, file_size)
+                    chunk_size_actual = end_pos - start_pos
+
+                    f.seek(start_pos)
+                    chunk = f.read(chunk_size_actual)
+
+                    if part_number - 1 < len(signed_urls):
+                        signed_url = signed_urls[part_number - 1]
+                    else:
+                        raise Exception("Upload URL error")
+
+                    part = {"part_number": part_number, "size": len(chunk)}
+                    if self.hash_pool:
+                        etag, (md5, sha256) = await asyncio.gather(
+                            asyncio.to_thread(uploader.upload_file_part, signed_url, chunk, part_number, throttle),
+                            loop.run_in_executor(self.hash_pool, hash_part, chunk),
+                        )
+                        if len(etag) == 32 and etag.lower() != md5:
+                            raise Exception(f"Checksum mismatch on part {part_number}")
+                        part["md5"] = md5
+                        part["sha256"] = sha256
+                    else:
+                        etag = await asyncio.to_thread(uploader.upload_file_part, signed_url, chunk, part_number, throttle)
+
+                    part["etag"] = etag
+                    parts.append(part)
+
+                    current_time = time.time()
+                    if current_time - last_update_time >= 3 or part_number == total_parts:
+                        elapsed_time = current_time - upload_start_time
+                        progress_percent = (part_number / total_parts) * 100
+                        progress_bar = "🟩" * int(progress_percent / 10) + "⬜" * (10 - int(progress_percent / 10))
+                        
+                        uploaded_bytes = part_number * actual_chunk_size
+                        if uploaded_bytes > file_size:
+                            uploaded_bytes = file_size
+                        
+                        if elapsed_time > 0:
+                            speed = uploaded_bytes / elapsed_time
+                            remaining_bytes = file_size - uploaded_bytes
+                            eta = remaining_bytes / speed if speed > 0 else 0
+                        else:
+                            speed = 0
+                            eta = 0
+
+                        try:
+                            await report(
+                                f"Uploading...\n\nFile: `{file_name}`\nProgress: {progress_percent:.1f}%\n{progress_bar}\nPart: {part_number}/{total_parts}\nUploaded: {self.uploader._format_size(uploaded_bytes)} / {self.uploader._format_size(file_size)}\nSpeed: {self.uploader._format_size(speed)}/s\nETA: {eta:.0f}s"
+                            )
+                            last_update_time = current_time
+                        except Exception:
+                            pass
+
+            await report("Upload complete! Creating download link...")
+            result = await asyncio.to_thread(uploader.complete_upload, upload_id, key, parts, file_name, False)
+            
+            obj_id = result.get('id')
+            if not obj_id:
+                raise Exception("File ID error")
+            upload_succeeded = True
+            file_id = self.storage_pool.tag_id(account, obj_id)
+
+            public_link_data = await asyncio.to_thread(uploader.create_public_link, obj_id)
+            download_url = public_link_data.get('link', 'N/A')
+            
+            result = {
+                "file_name": file_name,
+                "file_size": file_size,
+                "file_id": file_id,
+                "download_url": download_url,
+                "total_time": time.time() - download_start,
+            }
+            
+            if file_hash:
+                result["sha256"] = await file_hash
+            
+            return result
+
+        finally:
+            self.active_uploads.pop(task, None)
+            upload_state["finished"].set()
+            if file_hash:
+                file_hash.cancel()
+                if not file_hash.cancelled():
+                    file_hash.exception()
+            if file_path and os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except Exception:
+                    pass
+            if reserved_size:
+                await self.staging.release(reserved_size)
+            if account:
+                self.storage_pool.release(account, upload_succeeded)
+
+    async def get_profile_text(self):
+        profile_text = ""
+        for account in self.storage_pool.accounts:
+            if not account["enabled"]:
+                continue
+            
+            profile = await asyncio.to_thread(self.storage_pool.fetch_profile, account)
+            
+            title = "User Profile" if len(self.storage_pool.accounts) == 1 else f"Account {account['index']}"
+            profile_text += f"""
+{title}
+
+Name: {profile.get('name', 'N/A')}
+Phone: {profile.get('phone', 'N/A')}
+ID: `{profile.get('id', 'N/A')}`
+Country: {profile.get('country', 'N/A')}
+Language: {profile.get('language', 'N/A')}
+Balance: {profile.get('withdrawable_balance', 0)}
+
+Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).strftime('%Y-%m-%d %H:%M')}
+"""
+        return profile_text
 
     async def show_file_list(self, message, callback_query=None):
         try:
-            files = await asyncio.to_thread(self.uploader.list_objects)
+            files = await asyncio.to_thread(self.storage_pool.list_objects)
             
             if files['count'] == 0:
                 keyboard = InlineKeyboardMarkup([
@@ -662,7 +1734,7 @@ Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).st
             
             for i, file_obj in enumerate(files['results'][:10], 1):
                 size = self.uploader._format_size(file_obj['size'])
-                file_id = file_obj['id']
+                file_id = file_obj['tagged_id']
                 file_list += f"{i}. **{file_obj['name']}**\n"
                 file_list += f"   {size} | ID `{file_id}`\n\n"
             
@@ -690,7 +1762,7 @@ Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).st
 
     async def show_management_options(self, message, callback_query=None):
         try:
-            files = await asyncio.to_thread(self.uploader.list_objects)
+            files = await asyncio.to_thread(self.storage_pool.list_objects)
             
             if files['count'] == 0:
                 keyboard = InlineKeyboardMarkup([
@@ -710,7 +1782,7 @@ Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).st
             keyboard_buttons = []
             for i, file_obj in enumerate(files['results'][:10], 1):
                 size = self.uploader._format_size(file_obj['size'])
-                file_id = file_obj['id']
+                file_id = file_obj['tagged_id']
                 file_name = file_obj['name']
                 
                 if len(file_name) > 30:
@@ -750,7 +1822,8 @@ Last Updated: {datetime.fromtimestamp(profile.get('object_last_modified', 0)).st
 
     async def delete_file(self, message, file_id, callback_query=None):
         try:
-            file_details = await asyncio.to_thread(self.uploader.get_file_details, int(file_id))
+            storage, obj_id = self.storage_pool.resolve_id(file_id)
+            file_details = await asyncio.to_thread(storage.get_file_details, obj_id)
             
             if not file_details:
                 error_text = f"File with ID `{file_id}` not found."
@@ -802,16 +1875,19 @@ Are you sure you want to delete this file?
             else:
                 progress_msg = await message.reply_text(progress_text)
             
-            delete_result = await asyncio.to_thread(self.uploader.delete_objects, [int(file_id)])
+            storage, obj_id = self.storage_pool.resolve_id(file_id)
+            delete_result = await asyncio.to_thread(storage.delete_objects, [obj_id])
             
-            file_details = await asyncio.to_thread(self.uploader.get_file_details, int(file_id))
+            file_details = await asyncio.to_thread(storage.get_file_details, obj_id)
             version_group = file_details.get('version_group', '') if file_details else ''
             
             if version_group:
                 permanent_delete = await asyncio.to_thread(
-                    self.uploader.delete_version_groups, [version_group]
+                    storage.delete_version_groups, [version_group]
                 )
             
+            self.file_index.remove(str(file_id))
+            
             success_text = f"""
 File Deleted Successfully
 
@@ -843,6 +1919,125 @@ File has been permanently deleted.
             else:
                 await progress_msg.edit_text(error_text, reply_markup=keyboard)
 
+    async def refresh_file_index(self):
+        async with self.index_refresh_lock:
+            self.file_index.begin_rebuild()
+            try:
+                files = await asyncio.to_thread(self.storage_pool.list_all_objects)
+            except Exception:
+                self.file_index.abort_rebuild()
+                raise
+            self.file_index.rebuild(files)
+            return len(files)
+
+    async def keep_file_index_fresh(self):
+        while True:
+            try:
+                count = await self.refresh_file_index()
+                print(f"File index refreshed ({count} files)")
+            except Exception as e:
+                print(f"File index error: {e}")
+            await asyncio.sleep(self.index_refresh_minutes * 60)
+
+    def record_upload(self, result):
+        self.file_index.add(str(result['file_id']), result['file_name'], result['file_size'])
+
+    async def show_search_results(self, message, callback_query=None, page=0):
+        page_size = 5
+        query = self.find_queries.get(message.chat.id)
+        
+        try:
+            if not query:
+                text = "Search expired\nPlease search again with `/find <query>`."
+                if callback_query:
+                    await callback_query.message.edit_text(text)
+                else:
+                    await message.reply_text(text)
+                return
+            
+            if not self.file_index.built_at:
+                await self.refresh_file_index()
+            
+            results = self.file_index.search(query)
+            
+            if not results:
+                keyboard = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("View Files", callback_data="list_files")],
+                    [InlineKeyboardButton("Main Menu", callback_data="main_menu")]
+                ])
+                text = f"No files match `{query}`."
+                
+                if callback_query:
+                    await callback_query.message.edit_text(text, reply_markup=keyboard)
+                else:
+                    await message.reply_text(text, reply_markup=keyboard)
+                return
+            
+            total_pages = (len(results) + page_size - 1) // page_size
+            page = max(0, min(page, total_pages - 1))
+            
+            search_text = f"Search Results\n\nQuery: `{query}`\nFound: **{len(results)}** files (page {page + 1}/{total_pages})\n\n"
+            
+            keyboard_buttons = []
+            for i, file_obj in enumerate(results[page * page_size:(page + 1) * page_size], page * page_size + 1):
+                size = self.uploader._format_size(file_obj['size'])
+                file_id = file_obj['tagged_id']
+                search_text += f"{i}. **{file_obj['name']}**\n"
+                search_text += f"   {size} | ID `{file_id}`\n\n"
+                
+                keyboard_buttons.append([
+                    InlineKeyboardButton(f"🔗 Link {i}", callback_data=f"link_{file_id}"),
+                    InlineKeyboardButton(f"❌ Delete {i}", callback_data=f"delete_{file_id}")
+                ])
+            
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"find_page_{page - 1}"))
+            if page < total_pages - 1:
+                navigation.append(InlineKeyboardButton("Next ➡️", callback_data=f"find_page_{page + 1}"))
+            if navigation:
+                keyboard_buttons.append(navigation)
+            keyboard_buttons.append([InlineKeyboardButton("Main Menu", callback_data="main_menu")])
+            
+            keyboard = InlineKeyboardMarkup(keyboard_buttons)
+            
+            if callback_query:
+                await callback_query.message.edit_text(search_text, reply_markup=keyboard)
+            else:
+                await message.reply_text(search_text, reply_markup=keyboard)
+                
+        except Exception as e:
+            error_text = f"Error searching files: {str(e)}"
+            if callback_query:
+                await callback_query.message.edit_text(error_text)
+            else:
+                await message.reply_text(error_text)
+
+    async def show_public_link(self, message, file_id, callback_query=None):
+        try:
+            storage, obj_id = self.storage_pool.resolve_id(file_id)
+            public_link_data = await asyncio.to_thread(storage.create_public_link, obj_id)
+            download_url = public_link_data.get('link', 'N/A')
+            
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("Open Link", url=download_url)],
+                [InlineKeyboardButton("Back to Search", callback_data="find_page_0")],
+                [InlineKeyboardButton("Main Menu", callback_data="main_menu")]
+            ])
+            text = f"Public Link\n\nFile ID: `{file_id}`\nDownload URL: `{download_url}`"
+            
+            if callback_query:
+                await callback_query.message.edit_text(text, reply_markup=keyboard, disable_web_page_preview=True)
+            else:
+                await message.reply_text(text, reply_markup=keyboard, disable_web_page_preview=True)
+                
+        except Exception as e:
+            error_text = f"Error creating link: {str(e)}"
+            if callback_query:
+                await callback_query.message.edit_text(error_text)
+            else:
+                await message.reply_text(error_text)
+
     async def cancel_delete_file(self, message, file_id, callback_query=None):
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("Manage Files", callback_data="manage_files")],
@@ -856,7 +2051,235 @@ File has been permanently deleted.
         else:
             await message.reply_text(text, reply_markup=keyboard)
 
+    async def run_upload(self, coro):
+        task = asyncio.create_task(coro)
+        try:
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        
+        if task.cancelled():
+            raise UploadInterrupted()
+        return task.result()
+
+    def record_interrupted_upload(self, source, file_name):
+        try:
+            interrupted = []
+            if os.path.exists(self.interrupted_file):
+                with open(self.interrupted_file, 'r') as f:
+                    interrupted = json.load(f)
+            
+            interrupted.append({
+                "chat_id": source["chat_id"],
+                "message_id": source["message_id"],
+                "file_name": file_name,
+                "interrupted_at": datetime.now().isoformat()
+            })
+            
+            with open(self.interrupted_file, 'w') as f:
+                json.dump(interrupted, f, indent=2)
+        except Exception as e:
+            print(f"Could not record interrupted upload {file_name}: {e}")
+
+    async def report_interrupted_uploads(self):
+        if not os.path.exists(self.interrupted_file):
+            return
+        
+        try:
+            with open(self.interrupted_file, 'r') as f:
+                interrupted = json.load(f)
+        except Exception as e:
+            print(f"Could not read {self.interrupted_file}: {e}")
+            return
+        
+        print(f"{len(interrupted)} uploads were interrupted by the last shutdown without their sender being told")
+        for upload in interrupted:
+            try:
+                await self.app.send_message(
+                    upload['chat_id'],
+                    f"Upload Interrupted\n\nFile: `{upload['file_name']}`\nThe bot restarted before this upload finished, please send the file again.",
+                    reply_to_message_id=upload['message_id']
+                )
+            except Exception:
+                pass
+        
+        os.remove(self.interrupted_file)
+
+    async def drain_uploads(self):
+        self.accepting_uploads = False
+        
+        uploads = dict(self.active_uploads)
+        if not uploads:
+            return
+        
+        print(f"Draining {len(uploads)} active uploads (timeout {self.drain_timeout:.0f}s)...")
+        waiters = {
+            asyncio.create_task(state["finished"].wait()): task
+            for task, state in uploads.items()
+        }
+        done, pending = await asyncio.wait(waiters, timeout=self.drain_timeout)
+        
+        if pending:
+            print(f"Interrupting {len(pending)} unfinished uploads...")
+            for waiter in pending:
+                waiters[waiter].cancel()
+            await asyncio.wait(pending, timeout=30)
+        
+        print("Drain complete")
+
+    def start_workers(self):
+        for i in range(self.worker_count):
+            env = dict(os.environ, BOT_MODE="worker", WORKER_ID=str(i))
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+            self.worker_processes.append(process)
+        if self.worker_processes:
+            print(f"Started {len(self.worker_processes)} upload workers")
+
+    async def stop_workers(self):
+        for process in self.worker_processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        
+        for process in self.worker_processes:
+            try:
+                await asyncio.to_thread(process.wait, self.drain_timeout + 30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    async def relay_progress(self):
+        while True:
+            try:
+                await self.relay_progress_once()
+            except Exception as e:
+                print(f"Progress relay error: {e}")
+            await asyncio.sleep(1)
+
+    async def relay_progress_once(self):
+        jobs = await asyncio.to_thread(self.job_queue.pending_updates)
+        for job in jobs:
+            keyboard = None
+            if job['status'] == "done":
+                result = json.loads(job['result'])
+                self.record_upload(result)
+                text, keyboard = self.upload_success_view(result)
+            elif job['status'] == "failed":
+                text, keyboard = self.upload_error_view(json.loads(job['result']).get('error', 'Unknown error'))
+            else:
+                text = job['progress']
+            
+            if text:
+                try:
+                    await self.app.edit_message_text(
+                        job['chat_id'],
+                        job['progress_message_id'],
+                        text,
+                        reply_markup=keyboard,
+                        disable_web_page_preview=True
+                    )
+                except Exception:
+                    pass
+            
+            await asyncio.to_thread(self.job_queue.mark_reported, job['id'], job['progress_seq'])
+
+    def load_bandwidth_settings(self):
+        settings = self.job_queue.get_setting("bandwidth")
+        if settings:
+            self.bandwidth.load(settings)
+
+    async def keep_job_leased(self, job):
+        while True:
+            await asyncio.sleep(self.job_queue.lease_seconds / 4)
+            try:
+                await asyncio.to_thread(self.job_queue.heartbeat, job['id'], job['worker'])
+                await asyncio.to_thread(self.load_bandwidth_settings)
+            except Exception as e:
+                print(f"Heartbeat error for job {job['id']}: {e}")
+
+    async def run_job(self, job):
+        async def report(text):
+            await asyncio.to_thread(self.job_queue.report_progress, job['id'], job['worker'], text)
+        
+        heartbeat_task = asyncio.create_task(self.keep_job_leased(job))
+        try:
+            if not job['file_id']:
+                raise Exception("Job has no file ID, please send the file again")
+            source = {
+                "media": job['file_id'],
+                "chat_id": job['chat_id'],
+                "message_id": job['message_id'],
+                "user_id": job['user_id'] or job['chat_id'],
+            }
+            result = await self.process_upload(source, job['file_name'], job['file_size'], report)
+            await asyncio.to_thread(self.job_queue.finish, job['id'], job['worker'], "done", result)
+        except asyncio.CancelledError:
+            self.job_queue.requeue(job['id'], job['worker'], f"Upload Interrupted\n\nFile: `{job['file_name']}`\nWaiting to resume...")
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self.job_queue.finish, job['id'], job['worker'], "failed", {"error": str(e)})
+        finally:
+            heartbeat_task.cancel()
+
+    async def worker_loop(self, worker_name):
+        while self.accepting_uploads:
+            job = await asyncio.to_thread(self.job_queue.claim, worker_name)
+            if not job:
+                await asyncio.sleep(1)
+                continue
+            await asyncio.to_thread(self.load_bandwidth_settings)
+            await self.run_job(job)
+
+    async def run_worker(self):
+        worker_name = f"worker_{self.worker_id}"
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        
+        loops = []
+        try:
+            await self.app.start()
+            
+            requeued = await asyncio.to_thread(self.job_queue.requeue_worker_jobs, worker_name)
+            if requeued:
+                print(f"Requeued {requeued} jobs left by a previous {worker_name}")
+            
+            loops = [
+                asyncio.create_task(self.worker_loop(f"{worker_name}.{i}"))
+                for i in range(self.worker_concurrency)
+            ]
+            print(f"Worker {self.worker_id} started with {len(loops)} upload slots")
+            
+            await stop_event.wait()
+            
+        except Exception as e:
+            print(f"Worker error: {e}")
+        finally:
+            try:
+                await self.drain_uploads()
+            except Exception as e:
+                print(f"Drain error: {e}")
+            
+            for task in loops:
+                task.cancel()
+            await asyncio.gather(*loops, return_exceptions=True)
+            
+            try:
+                if self.app.is_connected:
+                    await self.app.stop()
+            except Exception as e:
+                print(f"Stop error: {e}")
+            
+            if self.hash_pool:
+                self.hash_pool.shutdown(wait=False, cancel_futures=True)
+
     async def run(self):
+        if self.mode == "worker":
+            await self.run_worker()
+            return
+        
+        relay_task = None
+        index_task = None
         try:
             print("Connecting to Telegram...")
             await self.app.start()
@@ -867,16 +2290,129 @@ File has been permanently deleted.
             print(f"Bot ID: {me.id}")
             print("Waiting for messages...")
             
+            await self.report_interrupted_uploads()
+            
+            index_task = asyncio.create_task(self.keep_file_index_fresh())
+            
+            if self.mode == "front":
+                self.start_workers()
+                relay_task = asyncio.create_task(self.relay_progress())
+            
             await idle()
             
         except Exception as e:
             print(f"Bot error: {e}")
         finally:
+            try:
+                await self.drain_uploads()
+                if self.mode == "front":
+                    await self.stop_workers()
+            except Exception as e:
+                print(f"Drain error: {e}")
+            
+            if index_task:
+                index_task.cancel()
+            
+            if relay_task:
+                relay_task.cancel()
+                try:
+                    await self.relay_progress_once()
+                except Exception:
+                    pass
+            
             try:
                 if self.app.is_connected:
                     await self.app.stop()
-            except:
-                pass
+            except Exception as e:
+                print(f"Stop error: {e}")
+            
+            if self.hash_pool:
+                self.hash_pool.shutdown(wait=False, cancel_futures=True)
+
+async def benchmark_download(size_mb=256, connections=4, chunk_latency=0.02):
+    file_size = size_mb * 1024 * 1024
+    
+    async def fake_stream(offset, limit):
+        for index in range(offset, offset + limit):
+            await asyncio.sleep(chunk_latency)
+            start = index * ParallelDownloader.CHUNK_SIZE
+            yield b"\0" * min(ParallelDownloader.CHUNK_SIZE, file_size - start)
+    
+    file_path = Path("bench_download.tmp")
+    try:
+        for count in sorted({1, connections}):
+            start = time.time()
+            await ParallelDownloader(fake_stream, connections=count).download(file_path, file_size)
+            elapsed = time.time() - start
+            print(f"{count} range(s): {size_mb} MB in {elapsed:.2f}s ({size_mb / elapsed:.1f} MB/s)")
+    finally:
+        if file_path.exists():
+            file_path.unlink()
+
+async def benchmark_hash(size_mb=256, workers=4, part_mb=5):
+    file_size = size_mb * 1024 * 1024
+    part_size = part_mb * 1024 * 1024
+    block = os.urandom(1024 * 1024)
+    data = block * size_mb
+    parts = [data[pos:pos + part_size] for pos in range(0, file_size, part_size)]
+    
+    file_path = Path("bench_hash.tmp")
+    pool = create_hash_pool(workers)
+    try:
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, hash_part, b"") for _ in range(workers)))
+        
+        start = time.time()
+        for part in parts:
+            hash_part(part)
+        hash_file(str(file_path))
+        elapsed = time.time() - start
+        print(f"inline: {size_mb} MB in {elapsed:.2f}s ({size_mb / elapsed:.1f} MB/s)")
+        
+        start = time.time()
+        await asyncio.gather(
+            loop.run_in_executor(pool, hash_file, str(file_path)),
+            *(loop.run_in_executor(pool, hash_part, part) for part in parts),
+        )
+        elapsed = time.time() - start
+        print(f"{workers} processes: {size_mb} MB in {elapsed:.2f}s ({size_mb / elapsed:.1f} MB/s)")
+    finally:
+        pool.shutdown()
+        if file_path.exists():
+            file_path.unlink()
+
+async def benchmark_telegram_download(chat_id, message_id, connections=None):
+    bot = abrehamrahiBot()
+    connections = connections or bot.download_connections
+    file_path = Path("bench_download.tmp").resolve()
+    
+    await bot.app.start()
+    try:
+        message = await bot.app.get_messages(chat_id, message_id)
+        file_name, file_size, file_id = bot.get_file_info(message)
+        if not file_name:
+            print("Message has no document, video or audio")
+            return
+        
+        print(f"Benchmarking {file_name} ({bot.uploader._format_size(file_size)})")
+        for count in sorted({1, connections}):
+            start = time.time()
+            if count == 1:
+                await bot.app.download_media(message, file_name=str(file_path))
+            else:
+                await ParallelDownloader(
+                    lambda offset, limit: bot.app.stream_media(message, limit=limit, offset=offset),
+                    connections=count,
+                ).download(file_path, file_size)
+            elapsed = time.time() - start
+            print(f"{count} range(s): {bot.uploader._format_size(file_size / elapsed)}/s ({elapsed:.2f}s)")
+            file_path.unlink()
+    finally:
+        if file_path.exists():
+            file_path.unlink()
+        await bot.app.stop()
 
 async def main():
     bot = abrehamrahiBot()
@@ -884,7 +2420,14 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if len(sys.argv) > 1 and sys.argv[1] == "bench-download":
+            asyncio.run(benchmark_download(*(int(arg) for arg in sys.argv[2:4])))
+        elif len(sys.argv) > 1 and sys.argv[1] == "bench-hash":
+            asyncio.run(benchmark_hash(*(int(arg) for arg in sys.argv[2:5])))
+        elif len(sys.argv) > 3 and sys.argv[1] == "bench-download-telegram":
+            asyncio.run(benchmark_telegram_download(*(int(arg) for arg in sys.argv[2:5])))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("\nBot stopped by user!")
     except Exception as e:
@@ -0,0 +1,64 @@
+import time
+
+from bot import BandwidthLimiter, TokenBucket
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+    assert bucket.consume(10 * 1024 * 1024) == 0
+
+
+def test_bucket_waits_for_overdraft():
+    bucket = TokenBucket(64 * 1024)
+    assert bucket.consume(64 * 1024) == 0
+    wait = bucket.consume(32 * 1024)
+    assert 0.4 < wait <= 0.5
+
+
+def test_negative_rate_is_unlimited():
+    bucket = TokenBucket(-1024)
+    assert bucket.rate == 0
+    assert bucket.consume(1024 * 1024) == 0
+
+
+def test_bucket_is_idle_once_refilled(monkeypatch):
+    bucket = TokenBucket(64 * 1024)
+    bucket.consume(64 * 1024)
+    assert not bucket.is_idle(300)
+    
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 301)
+    assert bucket.is_idle(300)
+
+
+def test_user_override_applies_to_existing_bucket():
+    limiter = BandwidthLimiter(user_rate=128 * 1024)
+    assert limiter._user_bucket(1).rate == 128 * 1024
+    
+    limiter.set_user_rate(256 * 1024, user_id=1)
+    assert limiter._user_bucket(1).rate == 256 * 1024
+    assert limiter._user_bucket(2).rate == 128 * 1024
+
+
+def test_limits_are_split_between_workers():
+    limiter = BandwidthLimiter(global_rate=400 * 1024, user_rate=100 * 1024, shares=4)
+    assert limiter.global_bucket.rate == 100 * 1024
+    assert limiter._user_bucket(1).rate == 25 * 1024
+    assert limiter.to_dict()["global_rate"] == 400 * 1024
+
+
+def test_load_restores_settings():
+    limiter = BandwidthLimiter()
+    limiter.load({"global_rate": 1024, "user_rate": 2048, "user_overrides": {"5": 4096}})
+    assert limiter.to_dict() == {"global_rate": 1024, "user_rate": 2048, "user_overrides": {"5": 4096}}
+    assert limiter._user_bucket(5).rate == 4096
+
+
+def test_idle_user_buckets_are_pruned(monkeypatch):
+    limiter = BandwidthLimiter(user_rate=64 * 1024)
+    limiter._user_bucket(1)
+    
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + BandwidthLimiter.IDLE_SECONDS + 1)
+    limiter._user_bucket(2)
+    assert list(limiter.user_buckets) == [2]
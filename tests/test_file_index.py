@@ -0,0 +1,57 @@
+from bot import FileIndex
+
+
+def build(*names):
+    index = FileIndex()
+    index.rebuild([{"tagged_id": str(i), "name": name, "size": 0} for i, name in enumerate(names)])
+    return index
+
+
+def names(results):
+    return [file_obj['name'] for file_obj in results]
+
+
+def test_search_ranks_prefix_and_substring_first():
+    index = build("holiday_photos.zip", "my_holiday.mp4", "report.pdf")
+    assert names(index.search("holiday")) == ["holiday_photos.zip", "my_holiday.mp4"]
+
+
+def test_search_tolerates_typos():
+    index = build("presentation_final.pptx", "notes.txt")
+    assert names(index.search("presentaton")) == ["presentation_final.pptx"]
+
+
+def test_search_ignores_unrelated_names():
+    index = build("report.pdf", "invoice.pdf")
+    assert index.search("holiday") == []
+    assert index.search("  ") == []
+
+
+def test_add_and_remove_update_results():
+    index = build("report.pdf")
+    index.add("9", "report_2024.pdf", 10)
+    assert names(index.search("report")) == ["report.pdf", "report_2024.pdf"]
+    
+    index.remove("0")
+    assert names(index.search("report")) == ["report_2024.pdf"]
+
+
+def test_rebuild_replays_changes_made_while_listing():
+    index = build("old.txt")
+    index.begin_rebuild()
+    listing = [{"tagged_id": "0", "name": "old.txt", "size": 0}]
+    index.add("1", "uploaded_during_rebuild.txt", 0)
+    index.remove("0")
+    index.rebuild(listing)
+    
+    assert set(index.files) == {"1"}
+    assert index.search("old") == []
+    assert not index.rebuilding
+
+
+def test_aborted_rebuild_stops_recording_changes():
+    index = build()
+    index.begin_rebuild()
+    index.abort_rebuild()
+    index.add("1", "file.txt", 0)
+    assert index.pending_changes == []
@@ -0,0 +1,112 @@
+from contextlib import closing
+
+import pytest
+
+from bot import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), lease_seconds=60)
+
+
+def enqueue(queue, message_id=1):
+    return queue.enqueue(100, message_id, message_id + 1000, 7, f"file_{message_id}", f"file_{message_id}.bin", 1024)
+
+
+def expire_lease(queue, job_id):
+    with closing(queue._connect()) as conn:
+        conn.execute("UPDATE jobs SET updated_at = updated_at - ? WHERE id = ?", (queue.lease_seconds + 1, job_id))
+
+
+def test_claim_returns_jobs_in_order_once(queue):
+    first = enqueue(queue, 1)
+    second = enqueue(queue, 2)
+    
+    job = queue.claim("worker_0.0")
+    assert job['id'] == first
+    assert job['status'] == "running"
+    assert job['worker'] == "worker_0.0"
+    assert job['file_id'] == "file_1"
+    
+    assert queue.claim("worker_0.1")['id'] == second
+    assert queue.claim("worker_0.2") is None
+
+
+def test_running_job_is_reclaimed_after_lease_expires(queue):
+    job_id = enqueue(queue)
+    queue.claim("worker_0.0")
+    assert queue.claim("worker_1.0") is None
+    
+    expire_lease(queue, job_id)
+    job = queue.claim("worker_1.0")
+    assert job['id'] == job_id
+    assert job['worker'] == "worker_1.0"
+
+
+def test_heartbeat_keeps_lease(queue):
+    job_id = enqueue(queue)
+    queue.claim("worker_0.0")
+    expire_lease(queue, job_id)
+    
+    assert queue.heartbeat(job_id, "worker_0.0")
+    assert queue.claim("worker_1.0") is None
+
+
+def test_stale_worker_cannot_touch_reclaimed_job(queue):
+    job_id = enqueue(queue)
+    queue.claim("worker_0.0")
+    expire_lease(queue, job_id)
+    queue.claim("worker_1.0")
+    
+    assert not queue.heartbeat(job_id, "worker_0.0")
+    queue.report_progress(job_id, "worker_0.0", "stale progress")
+    queue.finish(job_id, "worker_0.0", "failed", {"error": "stale"})
+    
+    assert queue.pending_updates() == []
+    with closing(queue._connect()) as conn:
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert job['status'] == "running"
+    assert job['worker'] == "worker_1.0"
+    assert job['progress'] is None
+    
+    queue.finish(job_id, "worker_1.0", "done", {"file_id": "42"})
+    [job] = queue.pending_updates()
+    assert job['status'] == "done"
+
+
+def test_requeue_worker_jobs_releases_all_slots(queue):
+    enqueue(queue, 1)
+    enqueue(queue, 2)
+    enqueue(queue, 3)
+    queue.claim("worker_0.0")
+    queue.claim("worker_0.1")
+    queue.claim("worker_10.0")
+    
+    assert queue.requeue_worker_jobs("worker_0") == 2
+    assert queue.claim("worker_1.0")['message_id'] == 1
+
+
+def test_pending_updates_are_reported_once_and_finished_jobs_dropped(queue):
+    job_id = enqueue(queue)
+    queue.claim("worker_0.0")
+    queue.report_progress(job_id, "worker_0.0", "Uploading...")
+    
+    [job] = queue.pending_updates()
+    assert job['progress'] == "Uploading..."
+    queue.mark_reported(job_id, job['progress_seq'])
+    assert queue.pending_updates() == []
+    
+    queue.finish(job_id, "worker_0.0", "done", {"file_id": "42"})
+    [job] = queue.pending_updates()
+    queue.mark_reported(job_id, job['progress_seq'])
+    assert queue.pending_updates() == []
+    with closing(queue._connect()) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+
+
+def test_settings_round_trip(queue):
+    assert queue.get_setting("bandwidth") is None
+    queue.set_setting("bandwidth", {"global_rate": 1024})
+    queue.set_setting("bandwidth", {"global_rate": 2048})
+    assert queue.get_setting("bandwidth") == {"global_rate": 2048}
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from bot import ParallelDownloader
+
+CHUNK = ParallelDownloader.CHUNK_SIZE
+
+
+def chunk_source(file_size, fail_at=None, closed=None):
+    async def stream(offset, limit):
+        try:
+            for index in range(offset, offset + limit):
+                await asyncio.sleep(0.001 * (index % 3))
+                if index == fail_at:
+                    raise ConnectionError(f"chunk {index} failed")
+                start = index * CHUNK
+                yield bytes([index]) * min(CHUNK, file_size - start)
+        finally:
+            if closed is not None:
+                closed.append(offset)
+    return stream
+
+
+@pytest.mark.parametrize("connections", [1, 3, 4, 16])
+def test_ranges_are_written_in_place(tmp_path, connections):
+    file_size = 7 * CHUNK + 123
+    path = tmp_path / "100_1"
+    asyncio.run(ParallelDownloader(chunk_source(file_size), connections).download(path, file_size))
+    
+    data = path.read_bytes()
+    assert len(data) == file_size
+    assert all(data[index * CHUNK] == index for index in range(8))
+
+
+def test_short_stream_is_reported(tmp_path):
+    async def short(offset, limit):
+        yield b"x"
+    
+    with pytest.raises(Exception, match="Download incomplete"):
+        asyncio.run(ParallelDownloader(short, 2).download(tmp_path / "100_1", 2 * CHUNK))
+
+
+def test_failed_range_cancels_the_others(tmp_path):
+    file_size = 8 * CHUNK
+    closed = []
+    
+    async def run():
+        downloader = ParallelDownloader(chunk_source(file_size, fail_at=5, closed=closed), 4)
+        with pytest.raises(ConnectionError, match="chunk 5 failed"):
+            await downloader.download(tmp_path / "100_1", file_size)
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    
+    assert asyncio.run(run()) == []
+    assert sorted(closed) == [0, 2, 4, 6]
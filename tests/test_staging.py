@@ -0,0 +1,62 @@
+import asyncio
+import shutil
+from collections import namedtuple
+
+import pytest
+
+from bot import StagingArea
+
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+@pytest.fixture
+def free_space(monkeypatch):
+    space = {"free": 0}
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: DiskUsage(0, 0, space["free"]))
+    return space
+
+
+def test_has_room_respects_quota(tmp_path, free_space):
+    free_space["free"] = 10 * 1024 * 1024
+    staging = StagingArea(tmp_path, quota_bytes=100 * 1024)
+    asyncio.run(staging.reserve(60 * 1024))
+    
+    assert staging.has_room(40 * 1024)
+    assert not staging.has_room(41 * 1024)
+
+
+def test_has_room_keeps_min_free(tmp_path, free_space):
+    free_space["free"] = 1024 * 1024
+    staging = StagingArea(tmp_path, min_free_bytes=512 * 1024)
+    
+    assert staging.has_room(512 * 1024)
+    assert not staging.has_room(512 * 1024 + 1)
+
+
+def test_has_room_does_not_count_written_bytes_twice(tmp_path, free_space):
+    staging = StagingArea(tmp_path, min_free_bytes=4096)
+    free_space["free"] = 4096 + 8192 + 4096
+    asyncio.run(staging.reserve(8192))
+    
+    assert staging.has_room(4096)
+    
+    (tmp_path / "100_1").write_bytes(b"\1" * 8192)
+    free_space["free"] = 4096 + 4096
+    assert staging.has_room(4096)
+
+
+def test_reserve_fails_when_nothing_can_free_space(tmp_path, free_space):
+    free_space["free"] = 1024
+    staging = StagingArea(tmp_path)
+    with pytest.raises(Exception, match="Not enough disk space"):
+        asyncio.run(staging.reserve(4096))
+
+
+def test_sweep_only_removes_staged_downloads(tmp_path):
+    for name in ("100_1", "-100200_3", "-100200_4.temp", "important.conf", ".env", "100_1.bak"):
+        (tmp_path / name).write_bytes(b"x")
+    (tmp_path / "worker_0").mkdir()
+    
+    removed, freed = StagingArea(tmp_path).sweep_orphans()
+    assert (removed, freed) == (3, 3)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [".env", "100_1.bak", "important.conf", "worker_0"]